@@ -7,6 +7,7 @@ from constants import PROCESS_ID
 from constants import RUNNER_ID
 from events import trigger
 from filelock import FileLock
+from functools import lru_cache
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
@@ -26,6 +27,30 @@ class CloudscaleHTTPAdapter(HTTPAdapter):
             return super().send(request, *args, **kwargs)
 
 
+@lru_cache(maxsize=1)
+def shared_http_adapter():
+    """ Returns the HTTP adapter shared by all API instances of a process.
+
+    As the adapter holds the connection pool, this keeps connections to the
+    API alive across instances. Function scoped API instances therefore do
+    not need to open a new connection for each test.
+
+    """
+
+    # DELETE may fail on resources when they are being created, so we
+    # retry those a number of times
+    retry_strategy = Retry(
+        total=5,
+        status_forcelist=[400],
+        allowed_methods=["DELETE"],
+        backoff_factor=1
+    )
+
+    return CloudscaleHTTPAdapter(
+        max_retries=retry_strategy,
+    )
+
+
 class API(requests.Session):
     """ A primitive API client to the cloudscale.ch REST API.
 
@@ -52,20 +77,7 @@ class API(requests.Session):
         self.scope = scope
         self.read_only = read_only
 
-        # DELETE may fail on resources when they are being created, so we
-        # retry those a number of times
-        retry_strategy = Retry(
-            total=5,
-            status_forcelist=[400],
-            allowed_methods=["DELETE"],
-            backoff_factor=1
-        )
-
-        adapter = CloudscaleHTTPAdapter(
-            max_retries=retry_strategy,
-        )
-
-        self.mount("https://", adapter)
+        self.mount("https://", shared_http_adapter())
 
     def post(self, url, data=None, json=None, **kwargs):
         assert not data, "Please only use json, not data"
@@ -434,6 +434,42 @@ def server(create_server, image):
     return create_server(image=image['slug'])
 
 
+@pytest.fixture(scope='session')
+def shared_server(create_server_for_session, image):
+    """ Session scoped server with only public networking, launched once per
+    image and shared by tests that do not change it.
+
+    """
+    return create_server_for_session(image=image['slug'])
+
+
+@pytest.fixture(scope='module')
+def module_server(create_server_for_session, image):
+    """ Module scoped server with only public networking, for tests in the
+    same module that build on each other's changes to the server.
+
+    """
+    server = create_server_for_session(image=image['slug'])
+
+    yield server
+
+    server.delete()
+
+
+@pytest.fixture(scope='function')
+def readonly_server(shared_server):
+    """ The shared server, for tests that do not modify the server, apart
+    from a name that is restored afterwards.
+
+    """
+    name = shared_server.name
+
+    yield shared_server
+
+    if shared_server.name != name:
+        shared_server.update(name=name)
+
+
 @pytest.fixture(scope='function')
 def server_with_private_net(create_server, image):
     """ Default server with private network. """
@@ -4,6 +4,7 @@ import re
 import secrets
 
 from hashlib import blake2b
+from ipaddress import ip_network
 
 # API access
 if not os.environ.get('CLOUDSCALE_API_TOKEN'):
@@ -40,11 +41,14 @@ RESOURCE_NAME_PREFIX = PROCESS_ID = f'at-{secrets.token_hex(4)}'
 # The worker ID in pytest-xdist, or master in any other case.
 WORKER_ID = os.environ.get('PYTEST_XDIST_WORKER', 'master')
 
-# Space that is considered repeated white-space in one-liners
-REPEATED_WHITE_SPACE = re.compile(r'\s{2,}')
+# Characters that are not allowed in hostnames (of lower-case names)
+INVALID_HOSTNAME_CHARACTERS = re.compile(r'[^a-z0-9-\.]')
 
-# Matches an integer or floating point number
-NUMBERS = re.compile(r'[0-9]*\.?[0-9]+')
+# Dashes that are squeezed into a single dash in hostnames
+REPEATED_DASHES = re.compile(r'-{2,}')
+
+# The CGNAT address space (RFC6598), which we consider to be public
+CGNAT_NETWORK = ip_network('100.64.0.0/10')
 
 # How many seconds a server may feasibly take to start up
 SERVER_START_TIMEOUT = 240
@@ -52,6 +56,11 @@ SERVER_START_TIMEOUT = 240
 # How many resources may be spawned in parallel in a single call
 RESOURCE_CREATION_CONCURRENCY_LIMIT = 2
 
+# How many seconds to wait for configuration changes that the API does not
+# report as applied (may be tuned for the environment the tests run against)
+PROPAGATION_DELAY = float(
+    os.environ.get('CLOUDSCALE_PROPAGATION_DELAY') or '15')
+
 # Where events are logged
 EVENTS_PATH = 'events'
 
@@ -7,6 +7,7 @@ from datetime import timedelta
 from errors import ServerError
 from errors import Timeout
 from events import with_trigger
+from functools import cached_property
 from functools import lru_cache
 from hashlib import blake2b
 from ipaddress import ip_address
@@ -126,6 +127,9 @@ class Server(CloudscaleResource):
 
         self.jump_host = jump_host
 
+        # the packages installed through `install_packages`
+        self.installed_packages = set()
+
         self.spec = self.default_spec()
         self.spec.update(spec)
 
@@ -244,6 +248,37 @@ class Server(CloudscaleResource):
 
         raise NotImplementedError("No suitable HTTP client found")
 
+    def install_packages(self, *packages):
+        """ Installs the given packages using apt.
+
+        Packages that were already installed by an earlier call, or that are
+        part of the image, are skipped. The package index is only updated if
+        something needs to be installed. All of this is run through a single
+        SSH command.
+
+        """
+
+        missing = [p for p in packages if p not in self.installed_packages]
+
+        if not missing:
+            return
+
+        self.assert_run(oneliner(f"""
+            missing=$(
+                for package in {" ".join(missing)}; do
+                    dpkg -s $package > /dev/null 2>&1 || echo $package;
+                done
+            );
+
+            if [ -n "$missing" ]; then
+                sudo apt-get update --allow-releaseinfo-change -qq
+                && sudo DEBIAN_FRONTEND=noninteractive
+                apt-get install -y -qq -o Dpkg::Use-Pty=0 $missing;
+            fi
+        """))
+
+        self.installed_packages.update(missing)
+
     def create_host(self, timeout):
         """ Creates the testinfra host.
 
@@ -251,17 +286,22 @@ class Server(CloudscaleResource):
 
         """
 
+        # The timeout is given as wall-clock time, but waiting should not be
+        # affected by changes to the wall-clock
+        remaining = (timeout - datetime.now()).total_seconds()
+        deadline = time.monotonic() + remaining
+
         # Prepare the connection to the host
         connect = host_connect_factory(
             ip=self.ip(self.jump_host and 'private' or 'public', 4),
             username=self.image.get('default_username') or self.username,
             ssh_key=self.request.getfixturevalue('random_ssh_key'),
-            deadline=timeout,
+            deadline=deadline,
             jump_host=self.jump_host,
         )
 
         # Wait until we can connect
-        while datetime.now() < timeout:
+        while time.monotonic() < deadline:
             time.sleep(1)
 
             try:
@@ -286,6 +326,7 @@ class Server(CloudscaleResource):
 
         # The host is now ready to use
         self.host = host
+        self.__dict__.pop('interface_names', None)
 
         # Wait for cloud-init to finish
         has_cloud_init = self.run('command -v cloud-init').exit_status == 0
@@ -392,6 +433,9 @@ class Server(CloudscaleResource):
         self.api.patch(self.href, json=properties)
         self.wait_for(status='!changing')
 
+        # The interfaces may have changed
+        self.__dict__.pop('interface_names', None)
+
     def action(self, name, expected_status):
         """ Runs given action and waits for the expected status. """
 
@@ -632,8 +676,14 @@ class Server(CloudscaleResource):
 
         return False
 
-    def nth_interface_name(self, n):
-        """ Returns the interface name of the nth interface. """
+    @cached_property
+    def interface_names(self):
+        """ Returns the sorted names of all interfaces, except loopback.
+
+        The names are cached until the host is recreated, or the server is
+        updated (which may add or remove interfaces).
+
+        """
         paths = self.output_of('find /sys/class/net -type l').splitlines()
 
         names = (p.rsplit('/', 1)[-1] for p in paths)
@@ -642,7 +692,11 @@ class Server(CloudscaleResource):
 
         names.sort()
 
-        return names[n]
+        return names
+
+    def nth_interface_name(self, n):
+        """ Returns the interface name of the nth interface. """
+        return self.interface_names[n]
 
     @property
     def public_interface(self):
@@ -656,6 +710,22 @@ class Server(CloudscaleResource):
 
         return self.host.interface(self.nth_interface_name(1))
 
+    def wait_for_address(self, interface, timeout):
+        """ Waits up to `timeout` seconds for an address to be configured on
+        the given interface. Returns True if an address was found in time.
+
+        The check is repeated on the server itself, so the wait takes a single
+        SSH command, instead of one per attempt.
+
+        """
+
+        return self.run(oneliner(f"""
+            timeout {timeout} sh -c '
+                until ip -o address show dev {interface} | grep -q inet;
+                do sleep 0.25; done
+            '
+        """)).succeeded
+
     def ip_address_config(self, iface_type, ip_version, network=None):
         for interface in self.interfaces:
             if network and not interface['network']['uuid'] == network:
@@ -936,7 +1006,8 @@ class FloatingIP(CloudscaleResource):
 
 class Volume(CloudscaleResource):
 
-    def __init__(self, request, api, size, zone, volume_type='ssd'):
+    def __init__(self, request, api, size, zone, volume_type='ssd',
+                 server_uuids=None):
         super().__init__(request, api)
 
         self.spec = {
@@ -946,6 +1017,10 @@ class Volume(CloudscaleResource):
             'zone': zone
         }
 
+        # Volumes may be attached as part of their creation
+        if server_uuids:
+            self.spec['server_uuids'] = server_uuids
+
     @with_trigger('volume.create')
     def create(self):
         self.info = self.api.post('/volumes', json=self.spec).json()
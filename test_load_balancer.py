@@ -8,6 +8,7 @@ You can create, modify and delete TCP load balancers.
 """
 import pytest
 
+from constants import PROPAGATION_DELAY
 from time import sleep
 from util import build_http_url
 from util import get_backends_for_request
@@ -653,7 +654,7 @@ def test_frontend_allowed_cidr(prober, create_load_balancer_scenario):
 
     # Wait some time for the configuration to be applied. Unfortunately the API
     # does not provide this information
-    sleep(15)
+    sleep(PROPAGATION_DELAY)
 
     # Assert the load balancer works on IPv4 and DOES NOT work on IPv6
     prober.http_get(f'http://{load_balancer.vip(4)}/')
@@ -668,7 +669,7 @@ def test_frontend_allowed_cidr(prober, create_load_balancer_scenario):
 
     # Wait some time for the configuration to be applied. Unfortunately the API
     # does not provide this information
-    sleep(15)
+    sleep(PROPAGATION_DELAY)
 
     # Assert the load balancer works on IPv6 and DOES NOT work on IPv4
     prober.http_get(f'http://[{load_balancer.vip(6)}]/')
@@ -684,7 +685,7 @@ def test_frontend_allowed_cidr(prober, create_load_balancer_scenario):
 
     # Wait some time for the configuration to be applied. Unfortunately the API
     # does not provide this information
-    sleep(15)
+    sleep(PROPAGATION_DELAY)
 
     # Assert the load balancer does not work on IPv4 and IPv6
     with pytest.raises(AssertionError):
@@ -8,7 +8,9 @@ You can interconnect your servers securely over private networks:
 """
 
 from util import in_parallel
+from util import oneliner
 from util import retry_for
+from warnings import warn
 
 
 def test_private_ip_address_on_all_images(create_server, image):
@@ -18,18 +20,15 @@ def test_private_ip_address_on_all_images(create_server, image):
     server = create_server(image=image, use_private_network=True)
 
     # Get the private interface
-    interface = server.private_interface
+    interface = server.private_interface.name
 
     # If it takes longer than 5 seconds, print a warning
-    def assert_a_private_address():
-        assert interface.addresses
-
-    retry_for(seconds=5).or_warn(assert_a_private_address, msg=(
-        f'{server.name}: No private IP address after 5s'))
+    if not server.wait_for_address(interface, timeout=5):
+        warn(f'{server.name}: No private IP address after 5s')
 
     # If this all together takes more than 30 seconds, we count it as a failure
-    retry_for(seconds=25).or_fail(assert_a_private_address, msg=(
-        f'{server.name}: No private IP address after 30s'))
+    assert server.wait_for_address(interface, timeout=25), (
+        f'{server.name}: No private IP address after 30s')
 
 
 def test_private_network_connectivity_on_all_images(create_server, image,
@@ -137,9 +136,13 @@ def test_multiple_private_network_interfaces(create_server, image,
         },
     ))
 
-    # Server can ping other server over every private IPv4
-    for octet in range(15):
-        s1.ping(f'192.168.{octet}.2', tries=10, wait=1)
+    # Server can ping other server over every private IPv4 (in parallel, as
+    # each ping may take up to ten seconds to succeed)
+    in_parallel(
+        lambda octet: s1.ping(f'192.168.{octet}.2', tries=10, wait=1),
+        instances=range(15),
+        max_workers=15,
+    )
 
 
 def test_no_private_network_port_security(create_server, image, server_group):
@@ -170,14 +173,18 @@ def test_no_private_network_port_security(create_server, image, server_group):
     private = s1.private_interface.name
 
     with s1.host.sudo():
-        s1.assert_run(f'ip link set dev {private} down')
-        s1.assert_run(f'ip link set dev {private} address 02:00:00:00:00:01')
-        s1.assert_run(f'ip link set dev {private} up')
+        s1.assert_run(oneliner(f"""
+            ip link set dev {private} down
+            && ip link set dev {private} address 02:00:00:00:00:01
+            && ip link set dev {private} up
+        """))
 
     with s2.host.sudo():
-        s2.assert_run(f'ip link set dev {private} down')
-        s2.assert_run(f'ip link set dev {private} address 02:00:00:00:00:02')
-        s2.assert_run(f'ip link set dev {private} up')
+        s2.assert_run(oneliner(f"""
+            ip link set dev {private} down
+            && ip link set dev {private} address 02:00:00:00:00:02
+            && ip link set dev {private} up
+        """))
 
     # Ping should still work
     s1.ping(s2.ip('private', 4))
@@ -187,11 +194,17 @@ def test_no_private_network_port_security(create_server, image, server_group):
     s1_address = s1.ip('private', 4)
     s2_address = s2.ip('private', 4)
 
-    s1.assert_run(f'sudo ip addr del {s1_address}/24 dev {private}')
-    s2.assert_run(f'sudo ip addr del {s2_address}/24 dev {private}')
+    # Remove both addresses before adding them again, so that no address is
+    # ever present twice in the private network
+    in_parallel(lambda server, command: server.assert_run(command), instances=(
+        (s1, f'sudo ip addr del {s1_address}/24 dev {private}'),
+        (s2, f'sudo ip addr del {s2_address}/24 dev {private}'),
+    ))
 
-    s1.assert_run(f'sudo ip addr add {s2_address}/24 dev {private}')
-    s2.assert_run(f'sudo ip addr add {s1_address}/24 dev {private}')
+    in_parallel(lambda server, command: server.assert_run(command), instances=(
+        (s1, f'sudo ip addr add {s2_address}/24 dev {private}'),
+        (s2, f'sudo ip addr add {s1_address}/24 dev {private}'),
+    ))
 
     # Ping should continue to work
     s1.ping(s2.ip('private', 4))
@@ -258,15 +271,20 @@ def test_private_network_mtu(create_server, image, private_network):
         {'name': 's2', 'image': image, 'interfaces': interfaces},
     ))
 
-    # Configure the IP addresses on the servers
+    # Configure the IP addresses on the servers, together with the default
+    # MTU for private networks, which is 9000
     private = s1.private_interface.name
 
-    s1.assert_run(f'sudo ip addr add 192.168.100.1/24 dev {private}')
-    s2.assert_run(f'sudo ip addr add 192.168.100.2/24 dev {private}')
+    def configure(server, address):
+        server.assert_run(oneliner(f"""
+            sudo ip addr add {address}/24 dev {private}
+            && sudo ip link set dev {private} mtu 9000
+        """))
 
-    # The default MTU for private networks is 9000
-    s1.assert_run(f'sudo ip link set dev {private} mtu 9000')
-    s2.assert_run(f'sudo ip link set dev {private} mtu 9000')
+    in_parallel(configure, instances=(
+        (s1, '192.168.100.1'),
+        (s2, '192.168.100.2'),
+    ))
 
     # Assert that MTU is at least 1500
     s1.ping('192.168.100.2', size=1472, fragment=False)
@@ -283,8 +301,11 @@ def test_private_network_mtu(create_server, image, private_network):
     # Change the MTU to 4500
     private_network.change_mtu(4500)
 
-    s1.assert_run(f'sudo ip link set dev {private} mtu 4500')
-    s2.assert_run(f'sudo ip link set dev {private} mtu 4500')
+    in_parallel(
+        lambda server: server.assert_run(
+            f'sudo ip link set dev {private} mtu 4500'),
+        instances=(s1, s2),
+    )
 
     # Assert that MTU is at least 1500
     s1.ping('192.168.100.2', size=1472, fragment=False)
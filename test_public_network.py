@@ -12,6 +12,7 @@ import secrets
 
 from constants import PUBLIC_PING_TARGETS
 from ipaddress import ip_interface
+from util import in_parallel
 from util import nameservers
 from util import oneliner
 from util import retry_for
@@ -54,17 +55,27 @@ def test_public_network_connectivity_on_all_images(server):
 
     """
 
-    # Ping the targets once the server has been created
-    for address in PUBLIC_PING_TARGETS.values():
+    def ping(address):
         server.ping(address, count=3, interval=0.5)
 
+    # Ping the targets once the server has been created (in parallel, as the
+    # pings are independent of each other)
+    in_parallel(
+        ping,
+        instances=PUBLIC_PING_TARGETS.values(),
+        max_workers=len(PUBLIC_PING_TARGETS),
+    )
+
     # Stop/start server to ensure that it works even after that
     server.stop()
     server.start()
 
     # Ping the targets again, after the server has come back up
-    for address in PUBLIC_PING_TARGETS.values():
-        server.ping(address, count=3, interval=0.5)
+    in_parallel(
+        ping,
+        instances=PUBLIC_PING_TARGETS.values(),
+        max_workers=len(PUBLIC_PING_TARGETS),
+    )
 
 
 def test_public_network_mtu(server):
@@ -110,11 +121,8 @@ def test_public_network_port_security(ip_version, two_servers_in_same_subnet):
     victim, attacker = two_servers_in_same_subnet
 
     # For this test, some extra packages are required
-    victim.assert_run('sudo apt update --allow-releaseinfo-change')
-    victim.assert_run('sudo apt install -y curl')
-
-    attacker.assert_run('sudo apt update --allow-releaseinfo-change')
-    attacker.assert_run('sudo apt install -y curl ettercap-text-only tcpdump')
+    victim.install_packages('curl')
+    attacker.install_packages('curl', 'ettercap-text-only', 'tcpdump')
 
     ipv4 = victim.ip('public', 4)
     ipv6 = victim.ip('public', 6)
@@ -213,10 +221,27 @@ def test_reverse_ptr_record_of_server(create_server):
     ipv4 = server.ip('public', 4)
     ipv6 = server.ip('public', 6)
 
+    # Nameservers that already returned the expected record are not queried
+    # again on subsequent attempts, the others are queried in parallel
+    propagated = set()
+
     def assert_ptr_propagated():
-        for nameserver in nameservers('cloudscale.ch'):
-            assert reverse_ptr(ipv4, nameserver) == f'{server.name}.'
-            assert reverse_ptr(ipv6, nameserver) == f'{server.name}.'
+        pending = [
+            (nameserver, address)
+            for nameserver in nameservers('cloudscale.ch')
+            for address in (ipv4, ipv6)
+            if (nameserver, address) not in propagated
+        ]
+
+        records = in_parallel(
+            lambda nameserver, address: reverse_ptr(address, nameserver),
+            instances=pending)
+
+        for query, record in zip(pending, records):
+            if record == f'{server.name}.':
+                propagated.add(query)
+
+        assert propagated.issuperset(pending)
 
     retry_for(seconds=60).or_fail(
         assert_ptr_propagated,
@@ -233,9 +258,25 @@ def test_reverse_ptr_record_of_floating_ip(
     fip = create_floating_ip(
         ip_version=ip_version, region=region, reverse_ptr=ptr)
 
+    # Nameservers that already returned the expected record are not queried
+    # again on subsequent attempts, the others are queried in parallel
+    propagated = set()
+
     def assert_ptr_propagated():
-        for nameserver in nameservers('cloudscale.ch'):
-            assert reverse_ptr(fip, nameserver) == f'{ptr}.'
+        pending = [
+            nameserver for nameserver in nameservers('cloudscale.ch')
+            if nameserver not in propagated
+        ]
+
+        records = in_parallel(
+            lambda nameserver: reverse_ptr(fip, nameserver),
+            instances=pending)
+
+        for nameserver, record in zip(pending, records):
+            if record == f'{ptr}.':
+                propagated.add(nameserver)
+
+        assert propagated.issuperset(pending)
 
     retry_for(seconds=60).or_fail(
         assert_ptr_propagated,
@@ -244,6 +285,7 @@ def test_reverse_ptr_record_of_floating_ip(
     # Update the Floating IP with a non-FQDN value and wait for propagation
     ptr = f"at-{secrets.token_hex(4)}"
     fip.update(reverse_ptr=ptr)
+    propagated.clear()
 
     retry_for(seconds=60).or_fail(
         assert_ptr_propagated,
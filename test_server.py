@@ -11,99 +11,64 @@ API Docs: https://www.cloudscale.ch/en/api/v1
 
 """
 
-from util import extract_number
-from util import oneliner
-
-
-def test_change_flavor_from_flex_to_flex(create_server):
-    """ It is possible to change from one flex flavor to another. """
-
-    # Start a server with the flex-4-1 flavor
-    server = create_server(flavor='flex-4-1')
-
-    assert server.assigned_memory() == 4
-    assert server.assigned_cpus() == 1
-
-    # To change the flavor we need to stop the server first
-    server.stop()
-
-    # Change the flavor to flex-8-2
-    server.update(flavor='flex-8-2')
-
-    # Make sure the server has been scaled
-    server.start()
-
-    assert server.assigned_memory() == 8
-    assert server.assigned_cpus() == 2
-
-
-def test_change_flavor_from_flex_to_plus(create_server):
-    """ It is possible to change from a flex to a plus flavor. """
-
-    # Start a server with the flex-4-1 flavor
-    server = create_server(flavor='flex-4-1')
-
-    assert server.assigned_memory() == 4
-    assert server.assigned_cpus() == 1
-
-    # To change the flavor we need to stop the server first
-    server.stop()
-
-    # Change the flavor to plus-8-2
-    server.update(flavor='plus-8-2')
+import pytest
 
-    # Make sure the server has been scaled
-    server.start()
-
-    assert server.assigned_memory() == 8
-    assert server.assigned_cpus() == 2
+from util import in_parallel
+from util import oneliner
 
 
-def test_change_flavor_from_plus_to_flex(create_server):
-    """ It is possible to change from a plus to a flex flavor. """
+# Flavor changes covering all combinations of flex and plus flavors. They run
+# on the same server and in the order of their ids, each one starting from
+# the flavor the previous one ended with.
+FLAVOR_CHANGES = (
+    ('flex-4-1', 'flex-8-2'),
+    ('flex-8-2', 'plus-12-3'),
+    ('plus-12-3', 'plus-8-2'),
+    ('plus-8-2', 'flex-4-1'),
+)
 
-    # Start a server with the plus-8-2 flavor
-    server = create_server(flavor='plus-8-2')
 
-    assert server.assigned_memory() == 8
-    assert server.assigned_cpus() == 2
+@pytest.mark.parametrize('current, target', FLAVOR_CHANGES, ids=[
+    f'{current}-to-{target}' for current, target in FLAVOR_CHANGES
+])
+def test_change_flavor(module_server, current, target):
+    """ It is possible to change from flex and plus flavors to other flex and
+    plus flavors.
 
-    # To change the flavor we need to stop the server first
-    server.stop()
-
-    # Change the flavor to flex-4-1
-    server.update(flavor='flex-4-1')
+    """
 
-    # Make sure the server has been scaled
-    server.start()
+    server = module_server
 
-    assert server.assigned_memory() == 4
-    assert server.assigned_cpus() == 1
+    def change_flavor(flavor):
 
+        # To change the flavor we need to stop the server first
+        if server.status != 'stopped':
+            server.stop()
 
-def test_change_flavor_from_plus_to_plus(create_server):
-    """ It is possible to change from one plus flavor to another. """
+        server.update(flavor=flavor)
+        server.start()
 
-    # Start a server with the plus-8-2 flavor
-    server = create_server(flavor='plus-8-2')
+    def assert_flavor(flavor):
+        _, memory, cpus = flavor.split('-')
 
-    assert server.assigned_memory() == 8
-    assert server.assigned_cpus() == 2
+        assert server.assigned_memory() == int(memory)
+        assert server.assigned_cpus() == int(cpus)
 
-    # To change the flavor we need to stop the server first
-    server.stop()
+    # Start with the current flavor, in case the previous change did not run
+    # on this server (e.g. because it failed, or ran on another worker)
+    if server.flavor['slug'] != current:
+        change_flavor(current)
 
-    # Change the flavor to plus-12-3
-    server.update(flavor='plus-12-3')
+    assert_flavor(current)
 
     # Make sure the server has been scaled
-    server.start()
-
-    assert server.assigned_memory() == 12
-    assert server.assigned_cpus() == 3
+    change_flavor(target)
+    assert_flavor(target)
 
 
-def test_hostname(create_server):
+@pytest.mark.parametrize('name', ['node-1.example.org', 'node-1'],
+                         ids=['fqdn', 'simple'])
+def test_hostname(create_server, name):
     """ Servers can be named on creation, with some restrctions.
 
     During creation, the name must only contain letters (a-z), digits (0-9),
@@ -112,16 +77,13 @@ def test_hostname(create_server):
 
     """
 
-    # Servers can be created using a fully qualified domain name
-    server = create_server(name='node-1.example.org', auto_name=False)
-    assert server.output_of('hostname --fqdn') == 'node-1.example.org'
+    # Servers can be created using a fully qualified domain name, or a simple
+    # name, which is used as hostname
+    server = create_server(name=name, auto_name=False)
+    assert server.output_of('hostname --fqdn') == name
 
-    # Servers can be also be created using a simple name
-    server = create_server(name='node-1', auto_name=False)
-    assert server.output_of('hostname --fqdn') == 'node-1'
 
-
-def test_rename_server(server):
+def test_rename_server(readonly_server):
     """ Servers can be renamed at any time, with few restrictions.
 
     After creation, the name can be any 1-255 characters long. Unicode is
@@ -130,35 +92,34 @@ def test_rename_server(server):
     """
 
     # Server names can be chosen quite freely
-    server.update(name='hal-9000.example.org')
-    assert server.name == 'hal-9000.example.org'
+    readonly_server.update(name='hal-9000.example.org')
+    assert readonly_server.name == 'hal-9000.example.org'
 
     # Up to 255 characters are allowed
-    server.update(name='0' * 255)
-    assert len(server.name) == 255
+    readonly_server.update(name='0' * 255)
+    assert len(readonly_server.name) == 255
 
     # Feel free to use special characters
-    server.update(name='🤖-host')
-    assert server.name == '🤖-host'
+    readonly_server.update(name='🤖-host')
+    assert readonly_server.name == '🤖-host'
 
-    server.update(name='acme | cluster nodes | master')
-    assert server.name == 'acme | cluster nodes | master'
+    readonly_server.update(name='acme | cluster nodes | master')
+    assert readonly_server.name == 'acme | cluster nodes | master'
 
 
 def test_reboot_server(server):
     """ Servers can be rebooted using the API or through the shell. """
 
-    # Get the time of the last boot
-    boot_timestamp = server.output_of('uptime --since')
+    # Get the id of the current boot (it changes with every boot)
+    boot_id_command = 'cat /proc/sys/kernel/random/boot_id'
+    boot_id = server.output_of(boot_id_command)
 
     # Reboot the server through the API (automatically reconnects)
     server.reboot()
 
     # Make sure that the reboot happened
-    assert server.output_of('uptime --since') != boot_timestamp
-
-    # Update the time of the last boot
-    boot_timestamp = server.output_of('uptime --since')
+    previous_boot_id, boot_id = boot_id, server.output_of(boot_id_command)
+    assert boot_id != previous_boot_id
 
     # Try to reboot through the shell
     server.run('sudo systemctl reboot')
@@ -170,24 +131,23 @@ def test_reboot_server(server):
     server.connect()
 
     # Make sure that this reboot happened as well
-    assert server.output_of('uptime --since') != boot_timestamp
+    assert server.output_of(boot_id_command) != boot_id
 
 
 def test_stop_and_start_server(server):
     """ Servers can be stopped using the API or through the shell. """
 
-    # Get the time of the last boot
-    boot_timestamp = server.output_of('uptime --since')
+    # Get the id of the current boot (it changes with every boot)
+    boot_id_command = 'cat /proc/sys/kernel/random/boot_id'
+    boot_id = server.output_of(boot_id_command)
 
     # Stop the server through the API, then start it
     server.stop()
     server.start()
 
     # Make sure that the reboot happened
-    server.output_of('uptime --since') != boot_timestamp
-
-    # Update the time of the last boot
-    boot_timestamp = server.output_of('uptime --since')
+    previous_boot_id, boot_id = boot_id, server.output_of(boot_id_command)
+    assert boot_id != previous_boot_id
 
     # Try to stop the server through the shell
     server.run('sudo systemctl poweroff')
@@ -199,7 +159,7 @@ def test_stop_and_start_server(server):
     server.start()
 
     # Make sure the server was started
-    assert server.output_of('uptime --since') != boot_timestamp
+    assert server.output_of(boot_id_command) != boot_id
 
 
 def test_rename_server_group(server_group):
@@ -225,26 +185,33 @@ def test_no_cpu_steal_on_plus_flavor(create_server, image):
     server = create_server(image=image, flavor='plus-8-2')
 
     # We need a stress tool to saturate our cores
-    server.assert_run('sudo apt update --allow-releaseinfo-change ')
-    server.assert_run('sudo apt install -y stress')
+    server.install_packages('stress')
 
     # Run stress in the background, on all cores
     server.assert_run('sudo systemd-run stress --cpu 2')
 
-    # Observe CPU steal for 30 seconds
-    steal = server.output_of(oneliner("""
+    # Observe CPU steal for up to 30 seconds, stopping early once there was
+    # no CPU steal for 10 seconds in a row (20 consecutive samples). Only the
+    # number of samples and the maximum CPU steal are returned.
+    samples, max_steal = server.output_of(oneliner("""
         top -n 60 -d 0.5 -b
-        | egrep '^%Cpu'
-        | egrep -o '[0-9.]+ st'
-    """))
-
-    max_steal = max(extract_number(line) for line in steal.splitlines())
+        | awk '/^%Cpu/ && match($0, /[0-9.]+ st/) {
+            n++;
+            steal = substr($0, RSTART, RLENGTH - 3) + 0;
+            if (steal > max) max = steal;
+            calm = (steal <= 1) ? calm + 1 : 0;
+            if (calm == 20) exit;
+        } END { print n + 0, max + 0 }'
+    """)).split()
+
+    # Make sure the CPU steal was measured at all
+    assert int(samples) > 0
 
     # Make sure the CPU steal does not exceed 1%
-    assert max_steal <= 1
+    assert float(max_steal) <= 1
 
 
-def test_random_number_generator(server):
+def test_random_number_generator(readonly_server):
     """ Our servers come with a paravirtual random number generator.
 
     See https://www.cloudscale.ch/en/news/2020/03/09/entropy-random-numbers.
@@ -252,14 +219,14 @@ def test_random_number_generator(server):
     """
 
     # Make sure the 'rdrand' CPU feature is enabled
-    server.assert_run('grep -q rdrand /proc/cpuinfo')
+    readonly_server.assert_run('grep -q rdrand /proc/cpuinfo')
 
     # Ensure that we can also see the hwrng virtio device
     path = '/sys/devices/virtual/misc/hw_random/rng_available'
-    server.assert_run(f'grep -q virtio_rng {path}')
+    readonly_server.assert_run(f'grep -q virtio_rng {path}')
 
 
-def test_metadata_on_all_images(server):
+def test_metadata_on_all_images(readonly_server):
     """ All servers have access to metadata through a link-local IP address and
     a read-only config drive.
 
@@ -269,18 +236,32 @@ def test_metadata_on_all_images(server):
 
     # The config drive is usually available as /dev/sr0. But to be sure what
     # its device path is, we can query the block devices for a device with the
-    # label 'config-2'
-    path = server.output_of(
-        "lsblk --paths --output LABEL,NAME | grep config-2 | awk '{print $2}'")
-
-    # We can mount this drive as a CD-ROM
-    server.assert_run(f'sudo mkdir /mnt/config-drive')
-    server.assert_run(f'sudo mount -t iso9660 {path} -o ro /mnt/config-drive')
+    # label 'config-2'. We can then mount this drive as a CD-ROM (and unmount
+    # it again afterwards, as the server is shared).
+    def read_config_drive():
+        return readonly_server.output_of(oneliner("""
+            path=$(
+                lsblk --paths --output LABEL,NAME
+                | awk '/config-2/{print $2}'
+            )
+
+            && sudo mkdir -p /mnt/config-drive
+            && sudo mount -t iso9660 $path -o ro /mnt/config-drive
+            && cat /mnt/config-drive/openstack/latest/meta_data.json
+            && sudo umount /mnt/config-drive
+        """))
+
+    # The same information is available through the metadata service
+    def read_metadata_service():
+        return readonly_server.http_get(
+            'http://169.254.169.254/openstack/latest/meta_data.json')
+
+    # Both sources are independent, so they are read in parallel
+    config_drive, metadata_service = in_parallel(
+        lambda read: read(),
+        instances=(read_config_drive, read_metadata_service),
+    )
 
     # Amongst other things we'll find the UUID of the server in the metadata
-    assert server.uuid in server.output_of(
-        'cat /mnt/config-drive/openstack/latest/meta_data.json')
-
-    # We can find the same information on the metadata service
-    assert server.uuid in server.http_get(
-        'http://169.254.169.254/openstack/latest/meta_data.json')
+    assert readonly_server.uuid in config_drive
+    assert readonly_server.uuid in metadata_service
@@ -8,11 +8,12 @@ volumes that can be attached, detached, and resized.
 
 """
 
-import time
+import json
 import pytest
 
 from requests.exceptions import HTTPError
-from util import extract_number
+from util import oneliner
+from util import retry_for
 
 # Volume sizes are measured in GiB
 GiB = 1024 ** 3
@@ -27,31 +28,31 @@ def test_attach_and_detach_volume_on_all_images(server, volume, image):
     # Attach the volume to the server
     volume.attach(server)
 
-    # Give some time for the change to actually propagate
-    time.sleep(5)
-
     # Virtio block device serial numbers contain at least the first 20 bytes
     # of the Volume UUID. On newer compute hosts this may be the full UUID.
     #
     # Note: The CSI driver relies on this behavior, changes to it may require
     # an upgrade of the CSI driver.
-    volume_paths = server.output_of(
-        f"ls -1 /dev/disk/by-id/*{volume.uuid[:20]}*").splitlines()
+    count_volume_paths = (
+        f"ls -1 /dev/disk/by-id/*{volume.uuid[:20]}* 2>/dev/null | wc -l")
 
-    # Some images refer to the same volume twice
-    assert 1 <= len(volume_paths) <= 2
+    # Wait for the volume to be present (some images refer to the same
+    # volume twice)
+    def assert_volume_present():
+        assert 1 <= int(server.output_of(count_volume_paths)) <= 2
 
-    # Check that volume is present
-    assert server.file_path_exists(volume_paths[0])
+    retry_for(seconds=10, pause=0.25).or_fail(
+        assert_volume_present, msg='Volume did not appear after 10s')
 
     # Detach volume from server
     volume.detach()
 
-    # Give some time for the change to actually propagate
-    time.sleep(5)
+    # Wait for the volume to no longer be present
+    def assert_volume_absent():
+        assert int(server.output_of(count_volume_paths)) == 0
 
-    # Check that volume is no longer present
-    assert not server.file_path_exists(volume_paths[0])
+    retry_for(seconds=10, pause=0.25).or_fail(
+        assert_volume_absent, msg='Volume still present after 10s')
 
 
 def test_expand_volume_online_on_all_images(create_server, image):
@@ -65,18 +66,18 @@ def test_expand_volume_online_on_all_images(create_server, image):
     server = create_server(image=image)
 
     # Ensure that the device size is 10 GiB
-    command = 'lsblk --bytes --nodeps --noheadings --output SIZE /dev/sda'
+    command = 'sudo blockdev --getsize64 /dev/sda'
     assert server.output_of(command) == str(10 * GiB)
 
     # Resize the root disk to 16 GiB
     server.scale_root_disk(16)
 
-    # Give some time for the change to actually propagate
-    time.sleep(5)
+    # Ensure that the device has been resized, once the change propagated
+    def assert_resized():
+        assert server.output_of(command) == str(16 * GiB)
 
-    # Ensure that the device has been resized
-    command = 'lsblk --bytes --nodeps --noheadings --output SIZE /dev/sda'
-    assert server.output_of(command) == str(16 * GiB)
+    retry_for(seconds=10, pause=0.25).or_fail(
+        assert_resized, msg='Device not resized after 10s')
 
 
 def test_expand_filesystem_online_on_common_images(create_server, image):
@@ -93,28 +94,33 @@ def test_expand_filesystem_online_on_common_images(create_server, image):
     # Resize the root disk (default is 10 GiB)
     server.scale_root_disk(16)
 
-    # Give some time for the change to actually propagate
-    time.sleep(5)
+    # Wait for the change to propagate
+    command = 'sudo blockdev --getsize64 /dev/sda'
 
-    # Get the name of the device that contains root
-    device = server.output_of('mount | grep -w / | cut -d " " -f 1')
+    def assert_resized():
+        assert server.output_of(command) == str(16 * GiB)
+
+    retry_for(seconds=10, pause=0.25).or_fail(
+        assert_resized, msg='Device not resized after 10s')
 
-    # Get the partition number of the device that contains root
-    partition = extract_number(device)
+    # Grow the root partition on the running system, then grow its filesystem
+    # using the appropriate method. This is done in a single command, which
+    # returns the name of the device that contains root.
+    device = server.output_of(oneliner("""
+        device=$(mount | grep -w / | cut -d " " -f 1)
+        && partition=$(echo $device | grep -o '[0-9]*$')
+        && fs_type=$(df --output=fstype $device | tail -n 1)
 
-    # Grow the root partition on the running system
-    server.assert_run(f'sudo growpart /dev/sda {partition}')
+        && sudo growpart /dev/sda $partition > /dev/null
 
-    # Get the device's filesystem
-    fs_type = server.output_of(f'df --output=fstype {device} | tail -n 1')
+        && case $fs_type in
+            ext4) sudo resize2fs $device > /dev/null ;;
+            xfs) sudo xfs_growfs / > /dev/null ;;
+            *) echo "No known resize command for $fs_type" >&2; exit 1 ;;
+        esac
 
-    # Grow the disk using the appropriate method
-    if fs_type == 'ext4':
-        server.assert_run(f'sudo resize2fs {device}')
-    elif fs_type == 'xfs':
-        server.assert_run('sudo xfs_growfs /')
-    else:
-        raise NotImplementedError(f"No known resize command for {fs_type}")
+        && echo $device
+    """))
 
     # Ensure that the device has been resized.
     # The /boot and /boot/efi partition may take up to 1249 MiB of space.
@@ -149,25 +155,29 @@ def test_expand_filesystem_on_boot_on_common_images(create_server, image):
     assert (16 * GiB - 1249 * MiB) <= server.fs_size(device) <= 16 * GiB
 
 
+@pytest.mark.slow
 def test_maximum_number_of_volumes(server, create_volume):
     """ It is possible to attach up to 128 additional volumes to a server.
 
     """
 
-    # Attach 127 volumes to the server (1 is already attached)
+    # Attach 127 volumes to the server (1 is already attached), by creating
+    # them attached, which takes a single API call per volume
     for _ in range(127):
-        volume = create_volume(size=10, volume_type="ssd")
-        volume.attach(server)
+        create_volume(size=10, volume_type="ssd", server_uuids=[server.uuid])
 
     # The server now has 128 disks
-    disks = server.output_of('lsblk | grep disk').splitlines()
+    devices = json.loads(server.output_of(
+        'lsblk --json --nodeps --output NAME,TYPE'))['blockdevices']
+
+    disks = [d['name'] for d in devices if d['type'] == 'disk']
     assert len(disks) == 128
 
     # The first disk is named 'sda'
-    assert disks[0].split(' ')[0] == 'sda'
+    assert disks[0] == 'sda'
 
     # The last disk is named 'sddx'
-    assert disks[-1].split(' ')[0] == 'sddx'
+    assert disks[-1] == 'sddx'
 
     # Try to attach one more volume (to reach 129), which fails
     with pytest.raises(HTTPError) as error:
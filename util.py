@@ -1,14 +1,16 @@
 import atexit
 import os
-import re
+import random
 import socket
+import struct
 import time
-import urllib
+import urllib.request
+import zlib
 
-from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
-from constants import NUMBERS
-from constants import REPEATED_WHITE_SPACE
+from constants import CGNAT_NETWORK
+from constants import INVALID_HOSTNAME_CHARACTERS
+from constants import REPEATED_DASHES
 from constants import RESOURCE_CREATION_CONCURRENCY_LIMIT
 from constants import RESOURCE_NAME_PREFIX
 from constants import RUNTIME_PATH
@@ -16,20 +18,21 @@ from constants import SERVER_START_TIMEOUT
 from contextlib import closing
 from contextlib import contextmanager
 from contextlib import suppress
-from datetime import datetime, timedelta
+from datetime import datetime
 from dns import reversename
 from dns.resolver import NXDOMAIN
 from dns.resolver import Resolver
 from errors import Timeout
 from functools import cached_property, lru_cache
-from hashlib import blake2b
+from ipaddress import IPv4Address
+from ipaddress import IPv6Address
 from ipaddress import ip_address
-from ipaddress import ip_network
 from paramiko import SSHClient, AutoAddPolicy
 from paramiko.ssh_exception import ChannelException
 from paramiko.ssh_exception import NoValidConnectionsError
 from paramiko.ssh_exception import SSHException
 from pathlib import Path
+from threading import current_thread
 from psutil import Process
 from testinfra.backend.paramiko import ParamikoBackend
 from types import SimpleNamespace
@@ -54,13 +57,15 @@ def global_run_id():
     proc = pytest_process()
 
     proc_id = f'{proc.pid}-{proc.create_time()}'
-    proc_id = blake2b(proc_id.encode('utf-8'), digest_size=8).hexdigest()
+    proc_id = f"{zlib.crc32(proc_id.encode('utf-8')):08x}"
 
     path = Path(f'{RUNTIME_PATH}/at-{proc_id}.runid')
 
-    if path.exists():
+    try:
         with path.open('r') as f:
             return f.read()
+    except FileNotFoundError:
+        pass
 
     with path.open('w') as f:
         timestamp = datetime.now().isoformat(timespec="milliseconds")
@@ -78,10 +83,13 @@ def global_run_id():
     return run_id
 
 
+@lru_cache(maxsize=None)
 def pytest_process(current_pid=None):
     """ Returns the top-most pytest process, which may or may not be
     controlling workers.
 
+    The result is cached, as the process tree does not change during a run.
+
     """
     pid = current_pid or os.getpid()
     process = Process(pid)
@@ -106,21 +114,13 @@ def is_matching_slug(image, fuzzy_slugs):
 
     """
 
-    for fuzzy_slug in fuzzy_slugs:
-        if fuzzy_slug in image['slug']:
-            return True
-
-    return False
+    return any(fuzzy_slug in image['slug'] for fuzzy_slug in fuzzy_slugs)
 
 
 def is_present_in_zone(image, zone_slug):
     """ Returns True if the given image is present in the given zone. """
 
-    for zone in image['zones']:
-        if zone['slug'] == zone_slug:
-            return True
-
-    return False
+    return any(zone['slug'] == zone_slug for zone in image['zones'])
 
 
 def generate_server_name(request, original_name=''):
@@ -136,10 +136,10 @@ def generate_server_name(request, original_name=''):
     name = f'{RESOURCE_NAME_PREFIX}-{scope}-{original_name or ""}'.lower()
 
     # Replace everything that is not allowed in a hostname by a -
-    name = re.sub(r'[^a-z0-9-\.]', '-', name)
+    name = INVALID_HOSTNAME_CHARACTERS.sub('-', name)
 
     # Squeeze repeated -
-    name = re.sub(r'-{2,}', '-', name)
+    name = REPEATED_DASHES.sub('-', name)
 
     # Truncate name to 63 characters, but keep the caller supplied name. This
     # part might be important to distinguish different servers in a test
@@ -152,7 +152,23 @@ def generate_server_name(request, original_name=''):
     return name
 
 
-def in_parallel(factory, instances=None, count=None):
+PARALLEL_POOL_PREFIX = 'at-parallel'
+
+
+@lru_cache(maxsize=1)
+def parallel_pool():
+    """ Returns the thread pool shared by all calls to in_parallel. """
+
+    pool = ThreadPoolExecutor(
+        max_workers=RESOURCE_CREATION_CONCURRENCY_LIMIT,
+        thread_name_prefix=PARALLEL_POOL_PREFIX,
+    )
+
+    atexit.register(pool.shutdown)
+    return pool
+
+
+def in_parallel(factory, instances=None, count=None, max_workers=None):
     """ Runs the given function in parallel with the given parameters.
 
     The canoncial usage should illustrate what this is all about:
@@ -166,6 +182,10 @@ def in_parallel(factory, instances=None, count=None):
 
         s1, s2 = in_parallel(some_function, count=2)
 
+    By default, at most RESOURCE_CREATION_CONCURRENCY_LIMIT calls run at the
+    same time. Work that does not create resources (e.g. pings over SSH) may
+    pass its own `max_workers`.
+
     """
 
     def create(instance):
@@ -184,10 +204,20 @@ def in_parallel(factory, instances=None, count=None):
     if count:
         instances = [{}] * count
 
-    max_workers = RESOURCE_CREATION_CONCURRENCY_LIMIT
+    # Nested calls (e.g. creating servers inside a parallel scenario) cannot
+    # wait on the shared pool they are running in, as that might deadlock.
+    # Calls with their own limit do not use the shared pool either.
+    nested = current_thread().name.startswith(PARALLEL_POOL_PREFIX)
+
+    if nested or max_workers:
+        # Use the same prefix, so deeper nesting is detected as well
+        with ThreadPoolExecutor(
+            max_workers=max_workers or RESOURCE_CREATION_CONCURRENCY_LIMIT,
+            thread_name_prefix=PARALLEL_POOL_PREFIX,
+        ) as pool:
+            return tuple(pool.map(create, instances))
 
-    with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        return tuple(pool.map(create, instances))
+    return tuple(parallel_pool().map(create, instances))
 
 
 def oneliner(text, shrink=True):
@@ -220,10 +250,10 @@ def oneliner(text, shrink=True):
     If repeated whitespace should be preserved, set `shrink` to False.
 
     """
-    line = ' '.join(s.strip() for s in text.splitlines())
-
     if shrink:
-        line = REPEATED_WHITE_SPACE.sub(' ', line)
+        return ' '.join(text.split())
+
+    line = ' '.join(s.strip() for s in text.splitlines())
 
     return line.strip()
 
@@ -232,9 +262,9 @@ class FaultTolerantParamikoBackend(ParamikoBackend):
     """ Overrides the ParamikoBackend of testinfra with a version that is
     better equipped to deal with suddenly disconnected SSH connections.
 
-    If there's an issue with the SSH connection, we retry for up to three
-    seconds. The default Paramiko backend does this as well, but it only
-    retries a single time.
+    If there's an issue with the SSH connection, we retry a few times, with
+    an exponential backoff between attempts. The default Paramiko backend
+    does this as well, but it only retries a single time.
 
     Additionally, this backend is initialised with a connection factory,
     instead of a set of configuration parameters.
@@ -244,7 +274,7 @@ class FaultTolerantParamikoBackend(ParamikoBackend):
     def __init__(self, client_factory, retries=3):
         super().__init__('paramiko://')
         self.client_factory = client_factory
-        self.retries = 3
+        self.retries = retries
 
     @cached_property
     def client(self):
@@ -259,13 +289,16 @@ class FaultTolerantParamikoBackend(ParamikoBackend):
     def run(self, command, *args, **kwargs):
         last_error = None
 
-        for _ in range(0, self.retries):
+        for attempt in range(0, self.retries):
             try:
                 return super().run(command, *args, **kwargs)
             except (SSHException, NoValidConnectionsError, TimeoutError) as e:
                 last_error = e
                 self.disconnect()
-                time.sleep(1)
+
+            # Back off with jitter, so parallel workers do not retry in sync
+            if attempt + 1 < self.retries:
+                time.sleep(0.5 * 2 ** attempt + random.uniform(0, 0.5))
 
         raise last_error
 
@@ -275,6 +308,7 @@ def host_connect_factory(ip, username, ssh_key, deadline, jump_host=None):
 
     * If the connection fails, it should be retried.
     * The result of the connect function is a connected paramiko client.
+    * The deadline is a point in time.monotonic() time.
 
     """
 
@@ -302,6 +336,18 @@ def host_connect_factory(ip, username, ssh_key, deadline, jump_host=None):
 
             raise
 
+        transport = client.get_transport()
+
+        # Detect dead connections early, instead of when the next command
+        # fails
+        transport.set_keepalive(15)
+
+        # Send small commands right away, instead of waiting for Nagle's
+        # algorithm (through a jump host, the socket is a paramiko channel)
+        if not jump_host:
+            transport.sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         return client
 
     return connect
@@ -314,44 +360,22 @@ def open_jump_host_channel(private_ip, jump_host, deadline):
     """
 
     transport = jump_host.host.backend.client.get_transport()
+    delay = 0.1
 
-    while datetime.now() < deadline:
-        time.sleep(1)
-
+    while time.monotonic() < deadline:
         with suppress(ChannelException, EOFError, SSHException):
             return transport.open_channel(
                 'direct-tcpip', (str(private_ip), 22), ('', 0))
 
+        time.sleep(delay)
+        delay = min(delay * 2, 2.0)
+
     raise Timeout(
         f'Connecting to the server from the jump-host took '
         f'longer than {SERVER_START_TIMEOUT}s'
     )
 
 
-def extract_number(text):
-    """ Extracts the first consecutive number in a text.
-
-    If no number can be extracted, an error is raised.
-
-    Examples:
-        "123 a 456" will return 123 (int)
-        "foo 123.12" will return 123.12 (float)
-
-    """
-
-    match = NUMBERS.search(text)
-
-    if not match:
-        raise RuntimeError(f"Could not find number in '{text}'")
-
-    number = match.group()
-
-    if '.' in number:
-        return float(number)
-
-    return int(number)
-
-
 def matches_attributes(obj, **attributes):
     """ Returns True if the given object has all the given attribute values.
 
@@ -420,9 +444,9 @@ class Retryable(object):
         self.exceptions = exceptions
 
     def or_fail(self, fn, msg=None, *args, **kwargs):
-        timeout = datetime.utcnow() + timedelta(seconds=self.seconds)
+        timeout = time.monotonic() + self.seconds
 
-        while datetime.utcnow() < timeout:
+        while time.monotonic() < timeout:
             try:
                 fn(*args, **kwargs)
             except self.exceptions as e:
@@ -443,6 +467,13 @@ class Retryable(object):
             warn(e)
 
 
+@lru_cache(maxsize=256)
+def argument_names(code):
+    """ Returns the names of the positional arguments of the given code. """
+
+    return code.co_varnames[:code.co_argcount]
+
+
 def arguments_as_namespace(fn, args, kwargs):
     """ Inspects functions signature and, given args and kwargs, returns a
     dictionary of all passed parameters, wheter passed as keyword arguments,
@@ -451,7 +482,7 @@ def arguments_as_namespace(fn, args, kwargs):
     See https://stackoverflow.com/a/40363565/138103
 
     """
-    names = fn.__code__.co_varnames[:fn.__code__.co_argcount]
+    names = argument_names(fn.__code__)
     return SimpleNamespace(**dict(zip(names, args)), **kwargs)
 
 
@@ -489,11 +520,7 @@ def dot_access(path, obj):
 
     """
 
-    dots = list(reversed(path.split('.')))
-
-    while dots:
-        dot = dots.pop()
-
+    for dot in path.split('.'):
         try:
             obj = obj[dot]
         except (KeyError, TypeError):
@@ -529,12 +556,15 @@ def raw_headers(url, method="GET"):
     # response headers by combining duplicate header field names and makes it
     # impossible to check for invalid or unwanted header configurations.
     request = urllib.request.Request(url=url, method=method)
-    headers = urllib.request.urlopen(request).getheaders()
 
-    result = defaultdict(list)
+    # Close the response without reading the body, only the headers matter
+    with urllib.request.urlopen(request) as response:
+        headers = response.getheaders()
+
+    result = {}
 
     for field_name, field_value in headers:
-        result[field_name].append(field_value)
+        result.setdefault(field_name, []).append(field_value)
 
     return result
 
@@ -546,21 +576,40 @@ def is_port_online(host, port, timeout=1.0):
     if hasattr(host, 'ip'):
         host = str(host.ip('public', 4))
 
-    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+
+    with closing(socket.socket(family, socket.SOCK_STREAM)) as sock:
         sock.settimeout(timeout)
 
+        # Reset the connection on close, instead of lingering in TIME_WAIT
+        sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+
         try:
             return sock.connect_ex((host, port)) == 0
         except socket.gaierror:
             return False
 
 
-def reverse_ptr(address, ns):
-    """ Queries the given nameserver for the PTR record of an IP. """
+@lru_cache(maxsize=32)
+def resolver_for(ns):
+    """ Returns a resolver that only queries the given nameserver.
+
+    PTR records are polled until they change, so only the resolver is
+    cached, not the records it serves.
+
+    """
 
     resolver = Resolver(configure=False)
     resolver.nameservers.append(socket.gethostbyname(ns))
 
+    return resolver
+
+
+def reverse_ptr(address, ns):
+    """ Queries the given nameserver for the PTR record of an IP. """
+
+    resolver = resolver_for(ns)
     reverse = reversename.from_address(str(address))
 
     try:
@@ -569,11 +618,17 @@ def reverse_ptr(address, ns):
         return None
 
 
+@lru_cache(maxsize=32)
 def nameservers(zone):
-    """ Returns the nameservers associated with a given zone. """
+    """ Returns the nameservers associated with a given zone.
+
+    The result is cached, as the nameservers of a zone do not change during
+    a test run.
+
+    """
 
     resolver = Resolver(configure=True)
-    return [str(s) for s in resolver.resolve(zone, 'NS')]
+    return tuple(str(s) for s in resolver.resolve(zone, 'NS'))
 
 
 def is_public(address):
@@ -587,12 +642,13 @@ def is_public(address):
 
     """
 
-    address = ip_address(address)
+    if not isinstance(address, (IPv4Address, IPv6Address)):
+        address = ip_address(address)
 
     if address.version == 6:
         return address.is_global
 
-    return address.is_global or address in ip_network('100.64.0.0/10')
+    return address.is_global or address in CGNAT_NETWORK
 
 
 def build_http_url(ip, path='/', port=None, ssl=False):
@@ -602,7 +658,10 @@ def build_http_url(ip, path='/', port=None, ssl=False):
 
     port = f':{port}' if port else ''
 
-    if ip_address(ip).version == 6:
+    if not isinstance(ip, (IPv4Address, IPv6Address)):
+        ip = ip_address(ip)
+
+    if ip.version == 6:
         ip = f'[{ip}]'
 
     return f'{method}://{ip}{port}{path}'
@@ -654,7 +713,15 @@ def get_backends_for_request(backends, url='/', status_code=200):
             | grep '"GET {url} HTTP/1.1" {status_code} -'
         ''')).succeeded
 
-    return list(filter(check_backend, backends))
+    # Query the backends in parallel, as each check is an SSH round-trip
+    backends = list(backends)
+
+    if not backends:
+        return []
+
+    hits = in_parallel(
+        check_backend, instances=backends, max_workers=len(backends))
+    return [backend for backend, hit in zip(backends, hits) if hit]
 
 
 def setup_lbaas_http_test_server(backend, ssl=False):
@@ -777,11 +844,12 @@ def extract_short_error(longrepr):
 
     prev = None
 
-    # Start from the bottom since that's nearer
-    for line in reversed(longrepr.splitlines()):
+    # Only look at the lines after the last '>', since that's nearer
+    tail = longrepr[longrepr.rfind('\n>') + 1:]
+
+    for line in tail.splitlines():
         if line.startswith('E'):
             prev = line
-        if line.startswith('>'):
             break
 
     return prev[1:].strip()